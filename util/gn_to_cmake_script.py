@@ -10,15 +10,27 @@
 import sys
 import json
 import os
-import string
+import re
 import logging
+from collections import deque
+from functools import cached_property, lru_cache
 from pathlib import Path
+from types import MappingProxyType
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
 
 # Must be aligned with the out_gen_path of the cmake_target template in the
 # tools/gn_tools/cmake_target_template.gni file. 
 PROJECT_FILE_NAME = "cmake_targets"
 
+IS_WINDOWS = sys.platform.startswith(('cygwin', 'win'))
+
 
+# The same paths and flags are escaped for every target that uses them.
+@lru_cache(maxsize=None)
 def cmake_string_escape(a):
   """Escapes the string 'a' for use inside a CMake string.
 
@@ -30,16 +42,87 @@ def cmake_string_escape(a):
   The following do not need to be escaped
   '#' when the lexer is in string state, this does not start a comment
   """
+  # Most paths and flags contain none of these, skip the copies for them.
+  if '\\' not in a and ';' not in a and '"' not in a:
+    return a
   return a.replace('\\', '\\\\').replace(';', '\\;').replace('"', '\\"')
 
+def dependencies_first_order(forward):
+  """
+  Sort the gn names of the graph forward (gn_name -> deps) with Kahn's
+  algorithm so that every gn name comes after its deps.
+  Deps that are not keys of forward are ignored.
+  """
+  reverse = {gn_name: [] for gn_name in forward}
+  pending = {}
+  for gn_name, deps in forward.items():
+    count = 0
+    for dep in deps:
+      if dep in reverse:
+        reverse[dep].append(gn_name)
+        count += 1
+    pending[gn_name] = count
+  ready = deque(gn_name for gn_name, count in pending.items() if count == 0)
+  order = []
+  while ready:
+    gn_name = ready.popleft()
+    order.append(gn_name)
+    for dependent in reverse[gn_name]:
+      pending[dependent] -= 1
+      if pending[dependent] == 0:
+        ready.append(dependent)
+  return order
+
 class Project:
   def __init__(self, project_json):
-    self.targets = project_json['targets']
+    # gn names are hashed and compared on every dependency lookup, intern the
+    # target names and the deps referring to them so equal names share one object.
+    self.targets = {}
+    for gn_name, properties in project_json['targets'].items():
+      deps = properties.get('deps')
+      if deps:
+        properties['deps'] = [sys.intern(dep) for dep in deps]
+      self.targets[sys.intern(gn_name)] = properties
     self.build_settings = project_json['build_settings']
     self.toolchains = project_json["toolchains"]
     self.root_path = self.build_settings['root_path']
     self.build_path = os.path.join(self.root_path,
                                      self.build_settings['build_dir'][2:])
+    # The generated CMakeLists of each cmake target go to this directory relative to its output_path.
+    self.cmake_impl_dir = os.path.join('CMakeLists_impl', Path(self.build_path).name)
+    self.target_cache = {}
+    self.source_path_cache = {}
+    self.written_targets = set()
+    # Classify every gn target once, instead of on each Target construction.
+    self.cmake_types = {gn_name: cmake_target_types.get(properties.get('type', None), None)
+                        for gn_name, properties in self.targets.items()}
+
+  def get_target(self, gn_name):
+    """
+    Return the Target of gn_name, constructing it only on first use
+    """
+    target = self.target_cache.get(gn_name)
+    if target is None:
+      target = Target(gn_name, self)
+      self.target_cache[gn_name] = target
+    return target
+
+  def get_sorted_dependencies(self, target):
+    """
+    Return the source and binary dependencies of target sorted by gn name
+    """
+    deps_source_targets, deps_binary_targets = target.find_all_dependencies(self)
+    return (sorted(deps_source_targets, key=lambda t:t.gn_name),
+            sorted(deps_binary_targets, key=lambda t:t.gn_name))
+
+  def collect_all_dep_actions(self):
+    """
+    Collect dep_actions of every target in one pass, visiting deps first
+    """
+    forward = {gn_name: properties.get('deps', []) for gn_name, properties in self.targets.items()}
+    for gn_name in dependencies_first_order(forward):
+      target = self.get_target(gn_name)
+      target.dep_actions = target.collect_dep_actions(self)
 
   def get_absolute_path(self, path):
     if path.startswith("//"):
@@ -47,17 +130,19 @@ class Project:
     return path
 
   def instead_source_path_prefix(self, path):
-    root_path = self.get_absolute_path(path).replace(self.root_path, "${ROOT_PATH}")
-    # for windows abs root fixing, remove the first char "/", eg: /C:/Users/xxx -> C:/Users/xxx
-    if sys.platform.startswith(('cygwin', 'win')):
-      return root_path.lstrip("/")
-    else:
-      return root_path
+    # The same sources, include dirs and outputs are rewritten for every
+    # target that references them, so the results are cached per path.
+    root_path = self.source_path_cache.get(path)
+    if root_path is None:
+      root_path = self.get_absolute_path(path).replace(self.root_path, "${ROOT_PATH}")
+      # for windows abs root fixing, remove the first char "/", eg: /C:/Users/xxx -> C:/Users/xxx
+      if IS_WINDOWS:
+        root_path = root_path.lstrip("/")
+      self.source_path_cache[path] = root_path
+    return root_path
 
   def instead_source_path_prefix_list(self, paths_list):
-    if len(paths_list) <= 0:
-      return []
-    return [self.instead_source_path_prefix(path) for path in paths_list]
+    return list(map(self.instead_source_path_prefix, paths_list))
 
 class CMakeTargetType:
   def __init__(self, command, modifier, property_modifier, is_linkable, is_dependency_barrier):
@@ -92,7 +177,19 @@ cmake_link_flags_tags = {
   'static_library': 'CMAKE_STATIC_LINKER_FLAGS',
 }
 
-SCRIPT_TARGETS = ['copy', 'action', 'action_foreach']
+SCRIPT_TARGETS = frozenset(['copy', 'action', 'action_foreach'])
+
+# Targets of these types are only useful if they compile something else than headers.
+SOURCES_CHECKED_TARGETS = frozenset(["executable", "loadable_module", "shared_library", "static_library", "source_set", "group"])
+
+HEADER_SUFFIXES = ('.h', '.hpp')
+
+# Packages and link modules of the targets without find_and_link_packages.
+EMPTY_PACKAGES = MappingProxyType({})
+EMPTY_MODULES = frozenset()
+
+# Every character that is not allowed in a CMake target name, see cmake_target_escape.
+CMAKE_TARGET_UNSAFE_CHAR = re.compile(r'[^A-Za-z0-9_.+-]')
 
 source_file_types = {
   '.cc': 'cxx',
@@ -120,14 +217,15 @@ class Metadata:
     
   
   def get_first_var(self, var_list, default_val):
-    return var_list[0] if len(var_list) > 0 else default_val
+    return var_list[0] if var_list else default_val
     
 
 class Target:
   def __init__(self, gn_name, project):
-    if not gn_name in project.targets.keys():
+    if gn_name not in project.targets:
       logging.error('Can not find target %s in your gn scripts' % (gn_name))
     self.gn_name = gn_name
+    self.project = project
     self.properties = project.targets[self.gn_name]
     self.gn_type = self.properties.get('type', None)
     self.metadata = Metadata(self.properties)
@@ -143,53 +241,65 @@ class Target:
     self.include_dirs = self.properties.get('include_dirs', [])
     self.ldflags = self.properties.get('ldflags', [])
     self.lib_dirs = self.properties.get('lib_dirs', [])
-    self.libs = self.properties.get('libs', [])
+    self.libs = list(self.properties.get('libs', []))
     self.sources = self.properties.get('sources', [])
     self.outputs = self.properties.get('outputs', [])
     self.script = self.properties.get('script', "")
     self.args = self.properties.get('args', [])
     self.response_file_contents = self.properties.get('response_file_contents', [])
-    self.declare_path = self.get_declare_path()
     self.dep_actions = set()
 
     # cmake attributes
     self.file_name = self.metadata.file_name
     self.project_name = self.metadata.project_name
     self.is_cmake_target = self.metadata.is_cmake_target
-    self.cmake_name = self.get_cmake_target_name()
-    self.cmake_type = cmake_target_types.get(self.gn_type, None)
-    self.deps_packages, self.link_modules = self.find_all_deps_packages(self.metadata.find_and_link_packages, project)
+    self.cmake_type = project.cmake_types[gn_name]
     self.output_path = self.metadata.output_path
     self.cmake_version = self.metadata.cmake_version
-    self.sub_cmake_target = self.collect_sub_cmake_target()
+    self.sub_cmake_target = self.collect_sub_cmake_target(project)
+
+  # The attributes below are only needed for the targets that are written,
+  # so they are computed on first access.
+  @cached_property
+  def declare_path(self):
+    return self.get_declare_path()
+
+  @cached_property
+  def cmake_name(self):
+    return self.get_cmake_target_name()
+
+  @cached_property
+  def deps_packages(self):
+    return self.find_all_deps_packages(self.metadata.find_and_link_packages, self.project)[0]
+
+  @cached_property
+  def link_modules(self):
+    return self.find_all_deps_packages(self.metadata.find_and_link_packages, self.project)[1]
 
   def get_declare_path(self):
     module_path = self.gn_name.split(':')[0]
     sub_path = module_path[2:]
-    if len(sub_path) > 0:
+    if sub_path:
       module_path += '/'
     return module_path
 
 
-  def collect_sub_cmake_target(self):
+  def collect_sub_cmake_target(self, project):
     need_link_sub_cmake_targets = self.metadata.sub_cmake_target_and_link
     for sub in need_link_sub_cmake_targets:
-      self.libs.append(Target(sub, project).output_name)
+      self.libs.append(project.targets[sub].get('output_name', ''))
     return need_link_sub_cmake_targets + self.metadata.sub_cmake_target
 
   def should_check_sources_target(self, target):
-    return target.gn_type in ["executable", "loadable_module", "shared_library", "static_library", "source_set", "group"]
+    return target.gn_type in SOURCES_CHECKED_TARGETS
 
   def is_useful_target(self, target):
     if not self.should_check_sources_target(target):
       return True
-    useful = False
-    if len(target.sources) > 0:
-      for source in target.sources:
-        if not source.endswith('.h') and not source.endswith('.hpp'):
-          useful = True
-          break
-    return useful
+    return any(not source.endswith(HEADER_SUFFIXES) for source in target.sources)
+
+  def is_binary_target(self, target):
+    return target.is_cmake_target or (target.cmake_type is not None and target.cmake_type.is_dependency_barrier)
 
   def get_directly_dependencies(self, project):
     """
@@ -197,7 +307,7 @@ class Target:
     """
     dep_targets = set()
     for dep in self.deps:
-      dep_target = Target(dep, project)
+      dep_target = project.get_target(dep)
       dep_targets.add(dep_target)
     return dep_targets
 
@@ -205,48 +315,48 @@ class Target:
     """
     Find all dependencies starting with this target
     """
+    # Targets are shared through project.target_cache, so reset the state
+    # accumulated by a previous traversal starting with this target.
+    deps_packages, link_modules = self.find_all_deps_packages(self.metadata.find_and_link_packages, project)
+    self.deps_packages = dict(deps_packages)
+    self.link_modules = set(link_modules)
     all_deps_source_targets = set()
     all_deps_binary_targets = set()
-    has_checked_targets = {}
-    has_checked_targets[self.gn_name] = self
     if self.is_useful_target(self):
       all_deps_source_targets.add(self)
-    for dep in self.deps:
-      dep_target = Target(dep, project)
-      if dep_target.gn_type in SCRIPT_TARGETS:
-        self.dep_actions.add(dep_target.cmake_name)
-      self.recursive_find_dependent_targets(project, dep_target, all_deps_source_targets, all_deps_binary_targets, has_checked_targets)
-      self.dep_actions = self.dep_actions.union(dep_target.dep_actions)
+    visited = {self.gn_name}
+    # Depth-first with an explicit stack, popping deps in declaration order so
+    # packages are merged in the same order as a recursive walk would.
+    stack = [project.get_target(dep) for dep in reversed(self.deps)]
+    while stack:
+      target = stack.pop()
+      if target.gn_name in visited:
+        continue
+      visited.add(target.gn_name)
+      # If the current target's type is cmake_target or a dependency barrier, add it to all_deps_binary_targets, and needn't to find its dependencies.
+      # Else, add it to all_deps_source_targets, and find its dependencies.
+      if self.is_binary_target(target):
+        all_deps_binary_targets.add(target)
+        continue
+      if self.is_useful_target(target):
+        all_deps_source_targets.add(target)
+        self.add_deps_packages(target)
+      stack.extend(project.get_target(dep) for dep in reversed(target.deps))
     return all_deps_source_targets, all_deps_binary_targets
-  
-  def recursive_find_dependent_targets(self, project, main_target, all_deps_source_targets, all_deps_binary_targets, has_checked_targets):
+
+  def collect_dep_actions(self, project):
     """
-    Recursive search dependencies
+    Collect the script targets this target depends on, through non-binary targets.
+    The dep_actions of the deps must have been collected already.
     """
-    # Check whether the current target has been found before to avoid an infinite loop.
-    if main_target.gn_name in has_checked_targets.keys():
-      main_target.dep_actions = has_checked_targets[main_target.gn_name].dep_actions
-      return 0
-    else:
-      has_checked_targets[main_target.gn_name] = main_target
-    # If the current target's type is cmake_target or a dependency barrier, add it to all_deps_binary_targets, and needn't to find its dependencies. 
-    # Else, add it to all_deps_source_targets, and recursively find its dependencies.
-    if main_target.is_cmake_target or main_target.cmake_type.is_dependency_barrier:
-      all_deps_binary_targets.add(main_target)
-      return 0
-    else:
-      if self.is_useful_target(main_target):
-        all_deps_source_targets.add(main_target)
-        self.add_deps_packages(main_target)
-    for dep in main_target.deps:
-      dep_target = Target(dep, project)
+    dep_actions = set()
+    for dep in self.deps:
+      dep_target = project.get_target(dep)
       if dep_target.gn_type in SCRIPT_TARGETS:
-        main_target.dep_actions.add(dep_target.cmake_name)
-      r = self.recursive_find_dependent_targets(project, dep_target, all_deps_source_targets, all_deps_binary_targets, has_checked_targets)
-      main_target.dep_actions = main_target.dep_actions.union(dep_target.dep_actions)
-      if r != 0:
-        return r
-    return 0
+        dep_actions.add(dep_target.cmake_name)
+      if not self.is_binary_target(dep_target):
+        dep_actions |= dep_target.dep_actions
+    return dep_actions
 
   def find_all_user_defines(self, target_list):
     """
@@ -260,32 +370,36 @@ class Target:
     return all_defines
 
   def add_deps_packages(self, target):
-    if len(target.deps_packages.keys()) > 0:
-      for package_name in target.deps_packages.keys():
-        if package_name in self.deps_packages.keys():
-          self.deps_packages[package_name][0] = self.deps_packages[package_name][0] or target.deps_packages[package_name][0]
-          self.deps_packages[package_name][1] = list(set(self.deps_packages[package_name][1]) | set(target.deps_packages[package_name][1]))
-        else:
-          self.deps_packages[package_name] = target.deps_packages[package_name]
-    if len(target.link_modules) > 0:
-      self.link_modules = set(set(self.link_modules) | set(target.link_modules))
+    for package_name, (configd, search_paths) in target.deps_packages.items():
+      package = self.deps_packages.get(package_name)
+      if package is None:
+        self.deps_packages[package_name] = (configd, search_paths)
+      else:
+        # Merge without reordering the search paths that are already known.
+        merged_search_paths = tuple(dict.fromkeys(package[1] + search_paths))
+        self.deps_packages[package_name] = (package[0] or configd, merged_search_paths)
+    self.link_modules |= target.link_modules
 
   def find_all_deps_packages(self, find_and_link_packages, project):
+    # Most targets don't declare packages, share the same empty results for them.
+    if not find_and_link_packages:
+      return EMPTY_PACKAGES, EMPTY_MODULES
     packages = {}
     modules = set()
-    if len(find_and_link_packages) > 0:
-      for package in find_and_link_packages:
-        package_name = package[0]
-        search_paths = project.instead_source_path_prefix_list(package[1])
-        configd = package[2] == "cmake::configd"
-        start_index = 3 if configd else 2
-        for module in package[start_index:]:
-          modules.add(module)
-        packages[package_name] = [configd, search_paths]
+    for package in find_and_link_packages:
+      package_name = package[0]
+      search_paths = project.instead_source_path_prefix_list(package[1])
+      configd = package[2] == "cmake::configd"
+      start_index = 3 if configd else 2
+      for module in package[start_index:]:
+        modules.add(module)
+      packages[package_name] = (configd, tuple(dict.fromkeys(search_paths)))
     return packages, modules
 
   def find_first_of(self, s, a):
-    return min(s.find(i) for i in a if i in s)
+    """Returns the index of the first occurrence in s of any string in a, or -1."""
+    indexes = [index for index in map(s.find, a) if index != -1]
+    return min(indexes) if indexes else -1
 
   def cmake_target_escape(self, a):
     """Escapes the string 'a' for use as a CMake target name.
@@ -293,12 +407,7 @@ class Target:
     CMP0037 in CMake 3.0 restricts target names to "^[A-Za-z0-9_.:+-]+$"
     The ':' is only allowed for imported targets.
     """
-    def Escape(c):
-      if c in string.ascii_letters or c in string.digits or c in '_.+-':
-        return c
-      return '__'
-
-    return ''.join([Escape(c) for c in a])
+    return CMAKE_TARGET_UNSAFE_CHAR.sub('__', a)
 
   def get_cmake_target_name(self):
     def extract_initial_path(path):
@@ -311,7 +420,7 @@ class Target:
     location = None
     name = None
     toolchain = None
-    if not path_separator:
+    if path_separator == -1:
       location = self.gn_name[2:]
     else:
       location = self.gn_name[2:path_separator]
@@ -329,7 +438,9 @@ class Target:
       location = extract_initial_path(location)
   
     cmake_target_name = None
-    if location.endswith('/' + name):
+    if not name:
+      cmake_target_name = location
+    elif location.endswith('/' + name):
       cmake_target_name = location
     elif location:
       cmake_target_name = location + '_' + name
@@ -341,119 +452,100 @@ class Target:
 
 class Writer:
   def __init__(self, output_path):
-    dir = os.path.dirname(output_path)
-    if not os.path.exists(dir):
-      os.makedirs(dir)
-    self.out = open(output_path, 'w+')
+    self.output_path = output_path
+    # Collect the generated content in memory, the directory and the file are
+    # only created in close(), so a failing target leaves nothing behind.
+    self.contents = []
+    self.write = self.contents.append
+    self.script_target_writers = {
+      'action': self.write_action_target,
+      'action_foreach': self.write_action_foreach_target,
+      'copy': self.write_copy_target,
+    }
+
+  def close(self):
+    os.makedirs(os.path.dirname(self.output_path), exist_ok=True)
+    with open(self.output_path, 'w', encoding='utf-8', newline='\n') as out:
+      out.write(''.join(self.contents))
 
   def write_header_info(self, target):
-    self.out.write('# Automatically generated by gn_to_cmake_script.py\n')
-    self.out.write('# Please modify configs of compilation in %sBUILD.gn\n' % target.declare_path)
-    self.out.write('\n')
-    self.out.write('# Set the minimum version of CMAKE that is required\n')
-    self.out.write('cmake_minimum_required(VERSION %s)\n' % target.cmake_version)
-    if target.project_name:
-      self.out.write('project (%s)\n' % target.project_name)
-    self.out.write('\n\n')
+    project_line = f'project ({target.project_name})\n' if target.project_name else ''
+    self.write('# Automatically generated by gn_to_cmake_script.py\n'
+               f'# Please modify configs of compilation in {target.declare_path}BUILD.gn\n'
+               '\n'
+               '# Set the minimum version of CMAKE that is required\n'
+               f'cmake_minimum_required(VERSION {target.cmake_version})\n'
+               f'{project_line}\n\n')
 
   def write_cmake_root_path(self, root_path):
-    self.out.write('set(ROOT_PATH %s)\n\n' % root_path)
+    self.write(f'set(ROOT_PATH {root_path})\n\n')
 
   def write_enable_asm(self):
-    self.out.write('enable_language(ASM)\n\n')
+    self.write('enable_language(ASM)\n\n')
 
   def write_script_target(self, script, arguments, target, project):
     if type(target) != Target:
       return -1
     script_target_temp_name = target.gn_type + '_target'
     self.write_single_variable('set', script_target_temp_name, target.cmake_name)
-    sources_path = []
-    for source in target.sources:
-      source_abs_path = project.instead_source_path_prefix(source)
-      sources_path.append(source_abs_path)
-    source_target_name =  '${%s}__sources' % script_target_temp_name
+    sources_path = project.instead_source_path_prefix_list(target.sources)
+    source_target_name = f'${{{script_target_temp_name}}}__sources'
     self.write_variable_list('set', source_target_name, sources_path)
+    sources_ref = f'${{{source_target_name}}}'
 
-    outputs = []
-    output_directories = set()
-    for output in target.outputs:
-      output_abs_path = project.instead_source_path_prefix(output)
-      outputs.append(output_abs_path)
-      output_directory = os.path.dirname(output_abs_path)
-      if output_directory:
-        output_directories.add(output_directory)
-    outputs_name = '${%s}__output' % script_target_temp_name
+    outputs = project.instead_source_path_prefix_list(target.outputs)
+    # dict.fromkeys dedups the directories and keeps them in output order.
+    output_directories = [d for d in dict.fromkeys(map(os.path.dirname, outputs)) if d]
+    outputs_name = f'${{{script_target_temp_name}}}__output'
     self.write_variable_list('set', outputs_name, outputs)
-    self.out.write('add_custom_command(OUTPUT ')
-    self.write_cmake_variable(outputs_name)
-    self.out.write('\n')
+    outputs_ref = f'${{{outputs_name}}}'
+    self.write(f'add_custom_command(OUTPUT {outputs_ref}\n')
     if output_directories:
-      self.out.write('  COMMAND ${CMAKE_COMMAND} -E make_directory "')
-      self.out.write('" "'.join([cmake_string_escape(d) for d in output_directories]))
-      self.out.write('"\n')
+      escaped_directories = '" "'.join([cmake_string_escape(d) for d in output_directories])
+      self.write(f'  COMMAND ${{CMAKE_COMMAND}} -E make_directory "{escaped_directories}"\n')
 
-    self.out.write('  COMMAND python3 "')
     script_rel_path = project.instead_source_path_prefix(script)
-    self.out.write(cmake_string_escape(script_rel_path))
-    self.out.write('"')
+    self.write(f'  COMMAND python3 "{cmake_string_escape(script_rel_path)}"')
     if arguments:
-      self.out.write('\n    "')
-      self.out.write('"\n    "'.join([cmake_string_escape(a) for a in arguments]))
-      self.out.write('"')
-    self.out.write('\n')
-    self.out.write('  DEPENDS ')
-    self.write_cmake_variable(source_target_name, ' ')
-    self.out.write('\n')
+      escaped_arguments = '"\n    "'.join([cmake_string_escape(a) for a in arguments])
+      self.write(f'\n    "{escaped_arguments}"')
+    self.write(f'\n  DEPENDS  {sources_ref}')
     build_path = project.instead_source_path_prefix(project.build_path)
-    self.out.write('  WORKING_DIRECTORY "')
-    self.out.write(cmake_string_escape(build_path))
-    self.out.write('"\n')
-    self.out.write('  COMMENT "%s: ${%s}"\n' % (target.gn_type, script_target_temp_name))
-    self.out.write('  VERBATIM)\n')
-    self.out.write(target.cmake_type.command)
-    self.out.write('(${%s}' % script_target_temp_name)
+    self.write(f'\n  WORKING_DIRECTORY "{cmake_string_escape(build_path)}"\n'
+               f'  COMMENT "{target.gn_type}: ${{{script_target_temp_name}}}"\n'
+               '  VERBATIM)\n'
+               f'{target.cmake_type.command}(${{{script_target_temp_name}}}')
     if target.cmake_type.modifier is not None:
-      self.out.write(' ')
-      self.out.write(target.cmake_type.modifier)
-    self.write_cmake_variable(source_target_name, ' ')
-    self.out.write(' DEPENDS')
-    self.write_cmake_variable(outputs_name, ' ')
-    self.out.write(')\n\n')
+      self.write(f' {target.cmake_type.modifier}')
+    self.write(f' {sources_ref} DEPENDS {outputs_ref})\n\n')
 
     other_libraries = set()
+    is_linkable = target.cmake_type.is_linkable
     for dependency in target.deps:
-      dep_target = Target(dependency, project)
-      cmake_dependency_type = cmake_target_types.get(dep_target.gn_type, None)
-      cmake_dependency_name = dep_target.cmake_name
+      dep_target = project.get_target(dependency)
+      cmake_dependency_type = dep_target.cmake_type
       if cmake_dependency_type.command != 'add_library':
-        other_libraries.add(cmake_dependency_name)
+        other_libraries.add(dep_target.cmake_name)
       elif cmake_dependency_type.modifier != 'OBJECT':
-        if not target.cmake_type.is_linkable:
-          other_libraries.add(cmake_dependency_name)
+        if not is_linkable:
+          other_libraries.add(dep_target.cmake_name)
     if other_libraries:
-      self.out.write('add_dependencies("${%s}"' % script_target_temp_name)
-      for other_library in other_libraries:
-        self.out.write('\n  "')
-        self.out.write(other_library)
-        self.out.write('"')
-      self.out.write(')\n\n')
-    self.out.write('\n')
-    
+      libraries = ''.join([f'\n  "{other_library}"' for other_library in other_libraries])
+      self.write(f'add_dependencies("${{{script_target_temp_name}}}"{libraries})\n\n')
+    self.write('\n')
+
     return target.cmake_name
 
   def storage_response_file_contents(self, target, project):
     response_file_contents = target.response_file_contents
     arguments = target.args
-    if len(response_file_contents) <= 0 or len(arguments) <= 0:
+    if not response_file_contents or not arguments:
       return arguments
     response_file_dir = os.path.join(project.build_path, 'rsp_files')
     response_file_path = os.path.join(response_file_dir, target.cmake_name + '.rsp')
-    if not os.path.exists(response_file_dir):
-      os.makedirs(response_file_dir, exist_ok=True)
-    with open(response_file_path, 'w+') as response_file:
-      for content in target.response_file_contents:
-        response_file.write(f"{content}\n")
-    response_file.close()
+    os.makedirs(response_file_dir, exist_ok=True)
+    with open(response_file_path, 'w') as response_file:
+      response_file.write(''.join(f"{content}\n" for content in target.response_file_contents))
     if '{{response_file_name}}' in arguments:
       index = arguments.index('{{response_file_name}}')
       arguments[index] = response_file_path
@@ -502,33 +594,38 @@ class Writer:
     return self.write_script_target(copy_script_path, arguments, target, project)
 
   def write_target_sources(self, target, project):
-    if len(target.sources) > 0:
+    if target.sources:
       sources_paths = project.instead_source_path_prefix_list(target.sources)
       cmake_type = target.cmake_type
       self.write_command_variable_list(cmake_type.command, target.cmake_name, 'OBJECT EXCLUDE_FROM_ALL', sources_paths)
 
   def write_target_defines(self, target):
     all_defines = sorted(set(target.defines))
-    if len(all_defines) > 0:
+    if all_defines:
       self.write_command_variable_list('target_compile_definitions', target.cmake_name, 'PRIVATE', all_defines)
 
   def write_target_include_dirs(self, target, project):
-    if len(target.include_dirs) > 0:
+    if target.include_dirs:
       include_dirs = project.instead_source_path_prefix_list(target.include_dirs)
       self.write_command_variable_list('target_include_directories', target.cmake_name, 'PRIVATE', include_dirs)
 
   def write_target_compile_flags(self, target):
-    if len(target.asmflags) > 0:
-      self.write_compile_options_list(target.cmake_name, 'PRIVATE', 'ASM', target.asmflags)
-    if len(target.cflags) > 0 or len(target.cflags_c) > 0:
-      c_flags = target.cflags + target.cflags_c
-      self.write_compile_options_list(target.cmake_name, 'PRIVATE', 'C', c_flags)
-    if len(target.cflags) > 0 or len(target.cflags_cc) > 0:
-      cc_flags = target.cflags + target.cflags_cc
-      self.write_compile_options_list(target.cmake_name, 'PRIVATE', 'CXX', cc_flags)
+    cmake_name = target.cmake_name
+    cflags = target.cflags
+    if target.asmflags:
+      self.write_compile_options_list(cmake_name, 'PRIVATE', 'ASM', target.asmflags)
+    # Only concatenate with the common cflags when there are language specific flags.
+    if target.cflags_c:
+      self.write_compile_options_list(cmake_name, 'PRIVATE', 'C', cflags + target.cflags_c)
+    elif cflags:
+      self.write_compile_options_list(cmake_name, 'PRIVATE', 'C', cflags)
+    if target.cflags_cc:
+      self.write_compile_options_list(cmake_name, 'PRIVATE', 'CXX', cflags + target.cflags_cc)
+    elif cflags:
+      self.write_compile_options_list(cmake_name, 'PRIVATE', 'CXX', cflags)
 
   def write_source_target(self, target, project):
-    if len(target.sources) > 0:
+    if target.sources:
       self.write_target_sources(target, project)
       self.write_target_defines(target)
       self.write_target_include_dirs(target, project)
@@ -537,39 +634,28 @@ class Writer:
       self.write_dep_actions(target.cmake_name, target.dep_actions)
 
   def write_target(self, target, project):
-    if target.gn_type == 'action':
-      self.write_action_target(target, project)
-    elif target.gn_type == 'action_foreach':
-      self.write_action_foreach_target(target, project)
-    elif target.gn_type == 'copy':
-      self.write_copy_target(target, project)
-    elif target.gn_type not in cmake_target_types.keys() or target.gn_type == None:
-      print(f"Warning: the {target.gn_type} of {target.gn_name} is not supported.")
-    elif len(target.sources) > 0 :
+    write_script_target = self.script_target_writers.get(target.gn_type)
+    if write_script_target is not None:
+      write_script_target(target, project)
+    elif target.gn_type not in cmake_target_types:
+      logging.warning('the %s of %s is not supported.', target.gn_type, target.gn_name)
+    elif target.sources:
       self.write_source_target(target, project)
 
   def write_main_target(self, target, deps_source_targets):
     cmake_type = target.cmake_type
-    self.out.write('\n# Main target\n')
-    self.out.write('%s(' % cmake_type.command)
-    self.out.write(target.output_name)
-    if cmake_type.modifier is not None:
-      self.out.write(' %s' % cmake_type.modifier)
-    self.out.write('\n  ')
-    if len(deps_source_targets) > 0:
-      for target in deps_source_targets:
-        if target.gn_type not in SCRIPT_TARGETS:
-          self.out.write('\n  $<TARGET_OBJECTS:%s>' % target.cmake_name)
-          self.out.write('\n  ')
-    self.out.write(')\n\n')
+    modifier = f' {cmake_type.modifier}' if cmake_type.modifier is not None else ''
+    objects = ''.join([f'\n  $<TARGET_OBJECTS:{dep.cmake_name}>\n  '
+                       for dep in deps_source_targets if dep.gn_type not in SCRIPT_TARGETS])
+    self.write(f'\n# Main target\n{cmake_type.command}({target.output_name}{modifier}\n  {objects})\n\n')
 
   def write_dep_actions(self, target_name, target_dep_actions):
     script_names = sorted(list(target_dep_actions))
-    if len(script_names) > 0:
+    if script_names:
       self.write_variable_list('add_dependencies', target_name, script_names)
 
   def write_lib_search_paths(self, target, project):
-    if len(target.lib_dirs) > 0:
+    if target.lib_dirs:
         dirs = project.instead_source_path_prefix_list(target.lib_dirs)
         self.write_current_target_link_directories(target.output_name, dirs)
 
@@ -583,92 +669,79 @@ class Writer:
       # CMAKE_LIBRARY_OUTPUT_DIRECTORY output on windows is different from unix
       # eg: C:\\a\\b\\c on windows, and C/a/b/c on unix
       # We should replace '\\' with '/' to avoid wrong library search path
-      self.out.write('string(REPLACE \n')
-      self.out.write('"\\\\" \n')
-      self.out.write('"/" \n')
-      self.out.write("%s \n" % (search_path_name))
-      self.out.write("${%s}) \n\n" % (search_path_name))
-
-      self.out.write("string(REPLACE \n")
-      self.out.write("%s \n" % (target_path))
-      self.out.write("%s \n" % (binary_target_path))
-      self.out.write("%s \n" % (search_path_name))
-      self.out.write("${%s}) \n\n" % (search_path_name))
-      target_paths.add("${%s}" % search_path_name)
-    if len(target_paths) > 0:
+      self.write('string(REPLACE \n'
+                 '"\\\\" \n'
+                 '"/" \n'
+                 f'{search_path_name} \n'
+                 f'${{{search_path_name}}}) \n\n'
+                 'string(REPLACE \n'
+                 f'{target_path} \n'
+                 f'{binary_target_path} \n'
+                 f'{search_path_name} \n'
+                 f'${{{search_path_name}}}) \n\n')
+      target_paths.add(f'${{{search_path_name}}}')
+    if target_paths:
       self.write_current_target_link_directories(target.output_name, target_paths)
 
   def write_target_link_libs(self, target, deps_binary_targets):
-    all_libs = set(target.libs) | set(target.link_modules)
+    all_libs = target.link_modules | set(target.libs)
     for binary_target in deps_binary_targets:
       all_libs.add(binary_target.output_name)
-    if len(all_libs) > 0:
-      all_libs_list = list(all_libs)
-      all_libs_list_sorted = sorted(all_libs_list)
-      self.write_variable_list('target_link_libraries', target.output_name, all_libs_list_sorted)
+    if all_libs:
+      self.write_variable_list('target_link_libraries', target.output_name, sorted(all_libs))
 
   def write_find_package(self, target, project):
     deps_packages = target.deps_packages
-    if len(deps_packages) <= 0:
+    if not deps_packages:
       return
-    for package_name in deps_packages.keys():
-      configd = deps_packages[package_name][0]
-      search_paths = deps_packages[package_name][1]
+    for package_name, (configd, search_paths) in deps_packages.items():
+      search_paths = list(search_paths)
       configd_str = ' REQUIRED CONFIG' if configd else ' '
-      search_path_str = ' PATHS ' if len(search_paths) > 0 else ''
+      search_path_str = ' PATHS ' if search_paths else ''
       self.write_variable_list('find_package', package_name + configd_str + search_path_str, search_paths)
 
   def write_link_package(self, target):
-    if len(target.link_modules) <= 0:
+    if not target.link_modules:
       return
     for module in target.link_modules:
         self.write_single_variable('target_link_libraries', target.cmake_name, module)
 
   def write_subdirectory(self, target, project):
-    if len(target.sub_cmake_target) > 0:
-      self.out.write('\n# subdirectory\n')
+    if target.sub_cmake_target:
+      self.write('\n# subdirectory\n')
     for sub in target.sub_cmake_target:
-      sub_target = Target(sub, project)
+      sub_target = project.get_target(sub)
       sub_target_path = project.instead_source_path_prefix(sub.split(':')[0])
       self.write_single_variable('add_subdirectory', sub_target_path, sub_target.output_name)
 
   def write_linker_flags(self, target):
-    if (len(target.ldflags)>0):
-      self.out.write('# Compiler and Linker flags\n')
+    if target.ldflags:
+      self.write('# Compiler and Linker flags\n')
       self.write_files_property(cmake_link_flags_tags.get(target.gn_type, 'CMAKE_SHARED_LINKER_FLAGS'), target.ldflags, ' ')
 
   # helper method
   def write_single_variable(self, type, variable_name, value):
     """Sets a CMake variable."""
-    self.out.write(type)
     if variable_name:
-      self.out.write('(')
-      self.out.write(cmake_string_escape(variable_name))
-      self.out.write(' \n  ')
+      self.write(f'{type}({cmake_string_escape(variable_name)} \n  {cmake_string_escape(value)}\n  )\n\n')
     else:
-      self.out.write('(')
-    self.out.write(cmake_string_escape(value))
-    self.out.write('\n  )\n\n')
+      self.write(f'{type}({cmake_string_escape(value)}\n  )\n\n')
 
   def write_command_variable_list(self, command_type, target_name, export_level, values):
     """Sets a CMake command's variable to a list."""
     if not (command_type and target_name and export_level and values):
       return
-    self.out.write(command_type)
-    self.out.write('(%s %s' % (cmake_string_escape(target_name), cmake_string_escape(export_level)))
-    self.out.write('\n  ')
-    self.out.write('\n  '.join([cmake_string_escape(value) for value in values]))
-    self.out.write('\n  )\n\n')
+    escaped_values = '\n  '.join([cmake_string_escape(value) for value in values])
+    self.write(f'{command_type}({cmake_string_escape(target_name)} {cmake_string_escape(export_level)}\n'
+               f'  {escaped_values}\n  )\n\n')
 
   def write_compile_options_list(self, target_name, export_level, compile_language, values):
     """Sets a CMake command's variable to a list."""
-    if not (target_name and export_level and compile_language and len(values) > 0):
+    if not (target_name and export_level and compile_language and values):
       return
-    self.out.write('target_compile_options')
-    self.out.write('(%s %s' % (cmake_string_escape(target_name), cmake_string_escape(export_level)))
-    self.out.write('\n  ')
-    self.out.write('$<$<COMPILE_LANGUAGE:%s>: "SHELL:%s" >'% (compile_language, ' '.join([cmake_string_escape(value) for value in values])))
-    self.out.write('\n  )\n\n')
+    escaped_values = ' '.join([cmake_string_escape(value) for value in values])
+    self.write(f'target_compile_options({cmake_string_escape(target_name)} {cmake_string_escape(export_level)}\n'
+               f'  $<$<COMPILE_LANGUAGE:{compile_language}>: "SHELL:{escaped_values}" >\n  )\n\n')
 
   def write_variable_list(self, type, variable_name, values):
     """Sets a CMake variable to a list."""
@@ -678,62 +751,38 @@ class Writer:
     if len(values) == 1:
       self.write_single_variable(type, variable_name, values[0])
       return
-    self.out.write(type)
+    escaped_values = '\n  '.join([cmake_string_escape(value) for value in values])
     if variable_name:
-      self.out.write('(')
-      self.out.write(cmake_string_escape(variable_name))
-      self.out.write('\n  ')
+      self.write(f'{type}({cmake_string_escape(variable_name)}\n  {escaped_values}\n  )\n\n')
     else:
-      self.out.write('(\n  ')
-    self.out.write('\n  '.join([cmake_string_escape(value) for value in values]))
-    self.out.write('\n  )\n\n')
+      self.write(f'{type}(\n  {escaped_values}\n  )\n\n')
 
   def write_files_property(self, property_name, values, sep):
     """Given a set of source files, sets the given property on them."""
-    self.out.write('set(')
-    self.out.write(property_name)
-    self.out.write(' "')
-    self.out.write('${')
-    self.out.write(property_name)
-    self.out.write('} ')
-    for value in values:
-      self.out.write(cmake_string_escape(value))
-      self.out.write(sep)
-    self.out.write('")\n\n')
+    escaped_values = ''.join([cmake_string_escape(value) + sep for value in values])
+    self.write(f'set({property_name} "${{{property_name}}} {escaped_values}")\n\n')
 
   def write_current_target_link_directories(self, target_name, target_paths, sep=''):
     """Given a target, sets the given link directories."""
-    self.out.write('target_link_directories(%s PUBLIC ' % target_name)
-    self.out.write(' ')
-    for value in target_paths:
-      self.out.write('\n  ')
-      self.out.write(cmake_string_escape(value))
-      self.out.write(sep)
-    self.out.write('\n  )\n\n')
-
-  def write_cmake_variable(self, variable_name, prepend=None):
-    if prepend:
-      self.out.write(prepend)
-    self.out.write('${')
-    self.out.write(variable_name)
-    self.out.write('}')
-  
+    escaped_paths = ''.join(['\n  ' + cmake_string_escape(value) + sep for value in target_paths])
+    self.write(f'target_link_directories({target_name} PUBLIC  {escaped_paths}\n  )\n\n')
+
 def write_project(project, target):
   if type(project) != Project or type(target) != Target:
     return -1
   start_target = target
+  # A cmake target may be reached from cmake_targets and as the sub_cmake_target
+  # of other ones, its CMakeLists and its sub targets only need to be written once.
+  if start_target.gn_name in project.written_targets:
+    return 0
+  project.written_targets.add(start_target.gn_name)
   if not start_target.cmake_type.is_linkable:
     raise Exception('The %s target specified in arguments must be a linkable target' % (start_target.gn_name))
 
   target_path = start_target.output_path
-  cmake_secondary_dir_name = Path(project.build_path).name
-  cmake_out_path = os.path.join(target_path, 'CMakeLists_impl', cmake_secondary_dir_name, target.file_name)
+  cmake_out_path = os.path.join(target_path, project.cmake_impl_dir, target.file_name)
   
-  deps_source_targets, deps_binary_targets = start_target.find_all_dependencies(project)
-  deps_source_targets_list = list(deps_source_targets)
-  deps_source_targets_list_sorted = sorted(deps_source_targets_list, key=lambda t:t.gn_name)
-  deps_binary_targets_list = list(deps_binary_targets)
-  deps_binary_targets_list_sorted = sorted(deps_binary_targets_list, key=lambda t:t.gn_name)
+  deps_source_targets_list_sorted, deps_binary_targets_list_sorted = project.get_sorted_dependencies(start_target)
   
   writer = Writer(cmake_out_path)
 
@@ -752,21 +801,24 @@ def write_project(project, target):
   writer.write_subdirectory(start_target, project)
   writer.write_target_link_libs(start_target, deps_binary_targets_list_sorted)
   writer.write_linker_flags(start_target)
+  writer.close()
 
   r = 0
   for sub in start_target.sub_cmake_target:
-    sub_target = Target(sub, project)
+    sub_target = project.get_target(sub)
     r |= write_project(project, sub_target)
   return r
 
 def gn_to_cmake(project_json_object, cmake_targets):
   project = Project(project_json_object)
+  project.collect_all_dep_actions()
+  targets = project.targets
   r = 0
   for target_name in cmake_targets:
-    if target_name not in project.targets.keys():
-      print("%s is not existed in GN project." % target_name)
+    if target_name not in targets:
+      logging.warning('%s is not existed in GN project.', target_name)
       continue
-    cmake_target = Target(target_name, project)
+    cmake_target = project.get_target(target_name)
     r |= write_project(project, cmake_target)
   return r
 
@@ -776,21 +828,18 @@ def read_json_file(json_file):
   if not os.path.exists(json_file):
     print("The json file %s is not existed." % json_file)
     return json_object
-  with open(json_file, "r+") as file:
-    json_object = json.loads(file.read())
-    file.close()
-  return json_object
+  data = Path(json_file).read_bytes()
+  # orjson decodes the large gn project json much faster than the json module.
+  if orjson is not None:
+    return orjson.loads(data)
+  return json.loads(data)
 
 def get_cmake_targets(cmake_targets_dir):
-  lines = []
-  for filename in os.listdir(cmake_targets_dir):
-    file_path = os.path.join(cmake_targets_dir, filename)
-    if os.path.isfile(file_path):
-      with open(file_path, "r+") as file:
-        lines += file.readlines()
-        file.close()
-  if len(lines) > 0:
-    cmake_targets = [line.replace("\n", "") for line in lines]
+  cmake_targets = []
+  with os.scandir(cmake_targets_dir) as entries:
+    for entry in entries:
+      if entry.is_file():
+        cmake_targets += Path(entry.path).read_text().splitlines()
   return cmake_targets
 
 def main():
@@ -799,7 +848,7 @@ def main():
     project_json_file = sys.argv[1]
     print(project_json_file)
     project = read_json_file(project_json_file)
-    if len(project) <= 0:
+    if not project:
       return -1
 
     gen_root_dir = os.path.dirname(project_json_file)
@@ -812,7 +861,7 @@ def main():
       error_tips = "You haven't defined the cmake_target in your GN project yet."
       custom_targets_file = os.path.join(gen_root_dir, PROJECT_FILE_NAME)
       cmake_targets = get_cmake_targets(custom_targets_file)
-      if len(cmake_targets) <= 0:
+      if not cmake_targets:
         print(error_tips)
         return -1
     print("cmake_targets: ", cmake_targets)
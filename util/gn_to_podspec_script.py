@@ -14,6 +14,13 @@ import os
 import posixpath
 import sys
 import re
+from functools import lru_cache
+from pathlib import Path
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
 
 # Must be aligned with the out_gen_path of the podspec_target template in the
 # tools/gn_tools/podspec_target_template.gni file. 
@@ -21,6 +28,11 @@ PROJECT_FILE_NAME = "podspec_targets"
 
 SPEC_HEAD_LENGTH = 30
 
+# The indentation and the spec variable name (p, sp, ssp, ...) of the common nesting
+# levels, deeper levels are computed on demand.
+PRE_SPACES = tuple('  ' * level for level in range(16))
+POD_HEADERS = tuple('s' * level + 'p' for level in range(16))
+
 PODFILE_LICENSE = '''# Copyright 2019 The Lynx Authors. All rights reserved. 
 # Licensed under the Apache License Version 2.0 that can be found in the 
 # LICENSE file in the root directory of this source tree.
@@ -42,49 +54,98 @@ should_use_colon_specification = [
   'scheme'
 ]
 
+# The root of the secondary gn files, stripped from the paths declared in it.
+SECONDARY_PATH = 'build/secondary/'
+
+# Sources with these suffixes are headers, the ones not listed in public_header_files are private.
+HEADER_SUFFIXES = ('.h', '.hpp', '.inc', '.inl')
+
+VERSION_NUMBER_PATTERN = re.compile(r'\d+')
+
+# Include dirs starting with one of these build variables are rewritten to reference
+# the variable, eg: //PODS_ROOT/xxx -> ${PODS_ROOT}/xxx
+INCLUDE_VARIABLE_PATTERN = re.compile(r'^//(PODS_ROOT|PODS_CONFIGURATION_BUILD_DIR|TARGET_BUILD_DIR|PODS_TARGET_SRCROOT)')
+
+def version_key(version_str):
+  """
+  Return the numeric components of a version string, eg: '~> 1.10.2' -> (1, 10, 2),
+  so that versions compare component by component.
+  """
+  return tuple(int(number) for number in VERSION_NUMBER_PATTERN.findall(version_str))
+
+@lru_cache(maxsize=4096)
+def format_include_dirs(include_dirs):
+  """
+  Return the quoted HEADER_SEARCH_PATHS entries of the include_dirs tuple.
+  The same search paths are written for every subspec that shares or flattens them,
+  so the results are cached.
+  """
+  format_includes = []
+  for include in include_dirs:
+    dir, replaced = INCLUDE_VARIABLE_PATTERN.subn(r'${\1}', include, count=1)
+    if not replaced and include.startswith('//'):
+      dir = '${PODS_TARGET_SRCROOT}/' + include[2:]
+    format_includes.append('\\\"' + dir + '\\\"')
+  return tuple(format_includes)
+
 class Project:
+  __slots__ = ('targets', 'build_settings', 'root_path', 'build_path', 'metadata_cache', 'subspec_cache')
+
   def __init__(self, project_json):
     self.targets = project_json['targets']
     self.build_settings = project_json['build_settings']
     self.root_path = self.build_settings['root_path']
     self.build_path = os.path.join(self.root_path,
                                      self.build_settings['build_dir'][2:])
+    self.metadata_cache = {}
+    self.subspec_cache = {}
+
+  def get_metadata(self, gn_name):
+    """
+    Return the SubspecMetadata of gn_name, parsing it only on first use
+    """
+    metadata = self.metadata_cache.get(gn_name)
+    if metadata is None:
+      metadata = SubspecMetadata(self.targets[gn_name])
+      self.metadata_cache[gn_name] = metadata
+    return metadata
+
+  def get_subspec_target(self, gn_name):
+    """
+    Return the SubspecTarget of gn_name, constructing it only on first use.
+    A subspec is written once per podspec that depends on it and flattened into
+    every subspec listing it in flatten_deps, but its content never changes.
+    """
+    if gn_name in self.subspec_cache:
+      subspec_target = self.subspec_cache[gn_name]
+      if subspec_target is None:
+        raise Exception("%s depends on itself through flatten_deps" % gn_name)
+      return subspec_target
+    # Mark gn_name as being constructed to report flatten_deps cycles.
+    self.subspec_cache[gn_name] = None
+    subspec_target = SubspecTarget(gn_name, self)
+    self.subspec_cache[gn_name] = subspec_target
+    return subspec_target
 
 class Metadata:
-  def __init__(self, properties, type):
-    metadata = properties.get('metadata', {})
-    if type.__name__ == 'PodspecTarget':
-      # podspec target metadata
-      self.condition_deps = metadata.get("condition_deps", [])
-      self.global_variables = metadata.get("global_variables", [])
-      self.output_name = self.get_first_var(metadata.get("output_name", []), "")
-      self.output_path = self.get_first_var(metadata.get("output_path", []), "")
-      self.root_specification = self.format_root_specification(self.get_first_var(metadata.get("root_specification", []), {}))
-    elif type.__name__ == 'SubspecTarget':
-      # subspec target metadata
-      self.condition_deps = metadata.get("condition_deps", [])
-      self.output_name = self.get_first_var(metadata.get("output_name", []), "")
-      self.test_subspec = self.get_first_var(metadata.get("test_subspec", []), False)
-      self.header_mappings_dir = self.get_first_var(metadata.get("header_mappings_dir", []), "")
-      self.requires_arc = metadata.get("requires_arc", [])
-      self.vendored_frameworks = metadata.get("vendored_frameworks", [])
-      self.vendored_libraries = metadata.get("vendored_libraries", [])
-      self.compiler_flags = metadata.get("compiler_flags", [])
-      self.public_header_files = metadata.get("public_header_files", [])
-      self.header_dir = self.get_first_var(metadata.get("header_dir", []), "")
-      self.frameworks = metadata.get("frameworks", [])
-      self.libraries = metadata.get("libraries", [])
-      self.resource_bundles = metadata.get("resource_bundles", [])
-      self.dependency = metadata.get("dependency", [])
-      self.pattern_source_files = metadata.get("pattern_source_files", [])
-      self.pattern_exclude_files = metadata.get("pattern_exclude_files", [])
-      self.pod_target_xcconfig = self.get_first_var(metadata.get("pod_target_xcconfig", []), {})
-      self.is_subspec_target = self.get_first_var(metadata.get("is_subspec_target", []), False)
-      self.flatten_deps = metadata.get("flatten_deps", [])
-  
+  """
+  The metadata of a gn target, parsed by PodspecMetadata or SubspecMetadata
+  """
   def get_first_var(self, var_list, default_val):
     return var_list[0] if len(var_list) > 0 else default_val
 
+class PodspecMetadata(Metadata):
+  """
+  The metadata of a podspec_target gn target
+  """
+  def __init__(self, properties):
+    metadata = properties.get('metadata', {})
+    self.condition_deps = metadata.get("condition_deps", [])
+    self.global_variables = metadata.get("global_variables", [])
+    self.output_name = self.get_first_var(metadata.get("output_name", []), "")
+    self.output_path = self.get_first_var(metadata.get("output_path", []), "")
+    self.root_specification = self.format_root_specification(self.get_first_var(metadata.get("root_specification", []), {}))
+
   def format_root_specification(self, root_specification):
     platform_names = set()
     for key in root_specification.keys():
@@ -97,15 +158,44 @@ class Metadata:
         root_specification[arg_new_name] = platform_args[arg_key]
     return root_specification
 
+class SubspecMetadata(Metadata):
+  """
+  The metadata of a subspec_target gn target
+  """
+  def __init__(self, properties):
+    metadata = properties.get('metadata', {})
+    self.condition_deps = metadata.get("condition_deps", [])
+    self.output_name = self.get_first_var(metadata.get("output_name", []), "")
+    self.test_subspec = self.get_first_var(metadata.get("test_subspec", []), False)
+    self.header_mappings_dir = self.get_first_var(metadata.get("header_mappings_dir", []), "")
+    self.requires_arc = metadata.get("requires_arc", [])
+    self.vendored_frameworks = metadata.get("vendored_frameworks", [])
+    self.vendored_libraries = metadata.get("vendored_libraries", [])
+    self.compiler_flags = metadata.get("compiler_flags", [])
+    self.public_header_files = metadata.get("public_header_files", [])
+    self.header_dir = self.get_first_var(metadata.get("header_dir", []), "")
+    self.frameworks = metadata.get("frameworks", [])
+    self.libraries = metadata.get("libraries", [])
+    self.resource_bundles = metadata.get("resource_bundles", [])
+    self.dependency = metadata.get("dependency", [])
+    self.pattern_source_files = metadata.get("pattern_source_files", [])
+    self.pattern_exclude_files = metadata.get("pattern_exclude_files", [])
+    self.pod_target_xcconfig = self.get_first_var(metadata.get("pod_target_xcconfig", []), {})
+    self.is_subspec_target = self.get_first_var(metadata.get("is_subspec_target", []), False)
+    self.flatten_deps = metadata.get("flatten_deps", [])
+
 class PodspecTarget:
   """
   The podspec object corresponding to the gn target
   """
+  __slots__ = ('gn_name', 'project', 'properties', 'deps', 'condition_deps', 'global_variables',
+               'output_name', 'output_path', 'root_specification')
+
   def __init__(self, gn_target_name, project):
     self.gn_name = gn_target_name
     self.project = project
     self.properties = project.targets[self.gn_name]
-    metadata = Metadata(self.properties, type(self))
+    metadata = PodspecMetadata(self.properties)
 
     self.deps = sorted(self.properties.get("deps", []))
     self.condition_deps = metadata.condition_deps
@@ -114,31 +204,41 @@ class PodspecTarget:
     self.output_path = metadata.output_path
     self.root_specification = metadata.root_specification
 
-SubspecTargetExcludeFlattenVar = [
+# The attribute names below are checked for every attribute of every flattened
+# subspec, so they are kept in frozensets.
+SubspecTargetExcludeFlattenVar = frozenset([
   'gn_name',
   'project',
   'properties',
   'output_name',
   'test_subspec',
   'flatten_deps'
-]
+])
 
-SubspecTargetFlattenStringVar = [
+SubspecTargetFlattenStringVar = frozenset([
   'header_dir',
   'header_mappings_dir'
-]
+])
 
 class SubspecTarget:
   """
   The subspec object corresponding to the gn target
   """
+  # flatten_subspec_targets merges the attributes of flattened subspecs by these names.
+  __slots__ = ('gn_name', 'project', 'properties', 'deps', 'source_files', 'exclude_files',
+               'output_name', 'test_subspec', 'requires_arc', 'vendored_frameworks',
+               'vendored_libraries', 'public_header_files', 'header_dir', 'header_mappings_dir',
+               'frameworks', 'libraries', 'dependency', 'dependency_versions', 'compiler_flags',
+               'resource_bundles', 'pod_target_xcconfig', 'subspec_targets_list', 'condition_deps',
+               'private_header_files', 'flatten_deps')
+
   def __init__(self, gn_target_name, project):
     if gn_target_name not in project.targets:
       raise Exception("%s is an illegal gn target for generate subspec" % gn_target_name)
     self.gn_name = gn_target_name
     self.project = project
     self.properties = project.targets[self.gn_name]
-    metadata = Metadata(self.properties, type(self))
+    metadata = project.get_metadata(self.gn_name)
     self.deps = sorted(self.properties.get("deps", []))
     self.source_files = self.format_root_path(self.properties.get("sources", []) + metadata.pattern_source_files)
     self.exclude_files = self.format_root_path(self.properties.get("exclude_sources", []) + metadata.pattern_exclude_files)
@@ -154,7 +254,7 @@ class SubspecTarget:
     self.libraries = metadata.libraries
     self.dependency, self.dependency_versions = self.parse_dependency(metadata.dependency)
     self.compiler_flags = metadata.compiler_flags
-    self.resource_bundles = self.get_resource_bundles()
+    self.resource_bundles = self.get_resource_bundles(metadata)
     self.pod_target_xcconfig = metadata.pod_target_xcconfig
     self.subspec_targets_list = self.find_all_dependencies()
     self.condition_deps = metadata.condition_deps
@@ -164,18 +264,16 @@ class SubspecTarget:
   def format_root_path(self, paths):
     if len(paths) <= 0:
       return paths
-    path_list = []
-    secondary_path = 'build/secondary/'
-    for path in paths:
-      path = path.replace('//', '')
-      if path.startswith(secondary_path):
-        path = path.replace(secondary_path, '')
-      path_list.append(path)
-    return sorted(path_list)
-
-  def string_to_int(self, version_str):
-    version_int = re.findall(r'\d+', version_str)
-    return int("".join(version_int))
+    return sorted(map(self.strip_root_path, paths))
+
+  def strip_root_path(self, path):
+    # Only the leading '//' and 'build/secondary/' are stripped, by slicing, so the
+    # rest of the path is neither scanned nor copied twice.
+    if path.startswith('//'):
+      path = path[2:]
+    if path.startswith(SECONDARY_PATH):
+      path = path[len(SECONDARY_PATH):]
+    return path
 
   def parse_dependency(self, dependencies):
     dependency_list = set()
@@ -188,36 +286,37 @@ class SubspecTarget:
         if len(dependency) == 2:
           if dependency_name in dependency_versions.keys():
             # If the version number of the dependency already exists, then keep the larger one. 
-            new_version_int = self.string_to_int(dependency_version)
-            old_version_int = self.string_to_int(dependency_versions[dependency_name])
-            if new_version_int > old_version_int:
+            if version_key(dependency_version) > version_key(dependency_versions[dependency_name]):
               dependency_versions[dependency_name] = dependency_version
           else:
             dependency_versions.update({dependency_name: dependency_version})
       else:
         dependency_list.add(dependency)
-    return dependency_list, dependency_versions
+    return sorted(dependency_list), dependency_versions
 
   def find_all_dependencies(self):
     subspec_targets_set = set()
+    # The sources of non-subspec deps are merged into a set and sorted once.
+    source_files = None
     for dep in self.deps:
-      dep_target = self.project.targets[dep]
-      metadata = Metadata(dep_target, type(self))
+      metadata = self.project.get_metadata(dep)
       if metadata.is_subspec_target:
         subspec_targets_set.add(dep)
       else:
-        self.source_files.extend(self.format_root_path(dep_target.get('sources', [])))
-        self.source_files = list(set(self.source_files))
-        self.source_files.sort()
+        if source_files is None:
+          source_files = set(self.source_files)
+        source_files.update(map(self.strip_root_path, self.project.targets[dep].get('sources', [])))
+    if source_files is not None:
+      self.source_files = sorted(source_files)
     if len(subspec_targets_set) > 0:
       subspec_targets_list = sorted(subspec_targets_set)
       return subspec_targets_list
     else: 
       return []
 
-  def get_resource_bundles(self):
+  def get_resource_bundles(self, metadata):
     resource_bundles = {}
-    resource_bundles_raw = Metadata(self.properties, type(self)).resource_bundles
+    resource_bundles_raw = metadata.resource_bundles
     if len(resource_bundles_raw) == 0:
       return resource_bundles
     for resource_bundle_name in resource_bundles_raw:
@@ -229,31 +328,16 @@ class SubspecTarget:
 
 
   def get_private_header_files(self):
-    sources = self.source_files
-    public_headers = self.public_header_files
-    test_subspec = self.test_subspec
-
-    public_paths = set()
-    for header in public_headers:
-      path = os.path.dirname(header)
-      public_paths.add(path)
-    private_paths = set()
-    private_headers = []
-    for source in sources:
-      if not (source.endswith('.h') or source.endswith('.hpp') or source.endswith('.inc') or source.endswith('.inl')):
-        continue
-      if source in public_headers:
-        continue
-      private_headers.append(source)
-    private_headers.sort()
-    return private_headers
+    # source_files is already sorted, so the filtered headers are sorted too.
+    public_headers = set(self.public_header_files)
+    return [source for source in self.source_files
+            if source.endswith(HEADER_SUFFIXES) and source not in public_headers]
 
   def get_flatten_deps(self, flatten_deps):
     flatten_targets_set = set()
     flatten_deps = sorted(flatten_deps)
     for dep in flatten_deps:
-      dep_target = self.project.targets[dep]
-      metadata = Metadata(dep_target, type(self))
+      metadata = self.project.get_metadata(dep)
       if metadata.is_subspec_target:
         flatten_targets_set.add(dep)
       else:
@@ -296,13 +380,15 @@ class SubspecTarget:
 
   def flatten_subspec_targets(self, subspec_targets_set):
     for subspec_target in subspec_targets_set:
-      flatten_sub = SubspecTarget(subspec_target, self.project)
-      for key, value in vars(flatten_sub).items():
+      flatten_sub = self.project.get_subspec_target(subspec_target)
+      for key in SubspecTarget.__slots__:
+        value = getattr(flatten_sub, key)
         if key == 'pod_target_xcconfig':
           self.add_dict_params(key, value, lambda v1, v2: set(v1) |set (v2), [])
           continue
         if key == 'dependency_versions':
-          self.add_dict_params(key, value, lambda v1, v2: v1 if self.string_to_int(v1) > self.string_to_int(v2) else v2, 1000000)
+          # A version missing on one side is '', which compares lower than any version.
+          self.add_dict_params(key, value, lambda v1, v2: v1 if version_key(v1) > version_key(v2) else v2, '')
           continue
         if key in SubspecTargetFlattenStringVar:
           self.para_competition(value, key)
@@ -314,125 +400,101 @@ class Writer:
   """
   Format content and then write formatted content to .podspec file
   """
+  __slots__ = ('project', 'output_path', 'contents', 'write')
+
   def __init__(self, target):
     self.project = target.project
-    path = os.path.join(target.output_path, target.output_name)
-    print("generate podspec file: %s" % path)
-    self.out = open(path, 'w+')
+    self.output_path = os.path.join(target.output_path, target.output_name)
+    print("generate podspec file: %s" % self.output_path)
+    # Collect the generated content in memory and write the file once in close().
+    self.contents = []
+    self.write = self.contents.append
+
+  def close(self):
+    with open(self.output_path, 'w') as out:
+      out.write(''.join(self.contents))
 
   def get_pod_header(self, level, test_subspec=False):
-    header = 's' * level + 'p'
     if test_subspec:
-      header = 'test_spec'
-    return header
+      return 'test_spec'
+    if level < len(POD_HEADERS):
+      return POD_HEADERS[level]
+    return 's' * level + 'p'
 
   def format_head_str(self, str, level):
     space = self.get_pre_spaces(level)
-    head_str = '%s%s' % (space, str)
+    head_str = f'{space}{str}'
     head_str = head_str.ljust(SPEC_HEAD_LENGTH + len(space), ' ')
     return head_str
 
   def format_include_headers(self, include_dirs):
-    format_includes = []
-    for include in include_dirs:
-      dir = ''
-      if include.startswith('//PODS_ROOT'):
-        dir = include.replace('//PODS_ROOT', '${PODS_ROOT}')
-      elif include.startswith('//PODS_CONFIGURATION_BUILD_DIR'):
-        dir = include.replace('//PODS_CONFIGURATION_BUILD_DIR', '${PODS_CONFIGURATION_BUILD_DIR}')
-      elif include.startswith('//TARGET_BUILD_DIR'):
-        dir = include.replace('//TARGET_BUILD_DIR', '${TARGET_BUILD_DIR}')
-      elif include.startswith('//PODS_TARGET_SRCROOT'):
-        dir = include.replace('//PODS_TARGET_SRCROOT', '${PODS_TARGET_SRCROOT}')
-      else:
-        dir = include.replace('//', '${PODS_TARGET_SRCROOT}/')
-      dir_str = '\\\"' + dir + '\\\"'
-      format_includes.append(dir_str)
-    format_includes.sort()
-    return format_includes
+    # Not sorted here, write_root_spec_list_internal sorts the values it writes.
+    return list(format_include_dirs(tuple(include_dirs)))
 
   def get_pre_spaces(self, level):
+    if level < len(PRE_SPACES):
+      return PRE_SPACES[level]
     return '  ' * level
 
   def write_header(self):
-    self.out.write(PODFILE_LICENSE)
+    self.write(PODFILE_LICENSE)
 
   def write_global_variables(self, global_variables):
     if global_variables == None or len(global_variables) == 0:
-      self.out.write('\n')
+      self.write('\n')
       return
-    self.out.write('\n')
+    self.write('\n')
     for variable in global_variables:
-      self.out.write(variable)
-      self.out.write('\n')
-    self.out.write('\n')
+      self.write(variable)
+      self.write('\n')
+    self.write('\n')
 
   def write_podspec_title(self, level):
-    self.out.write('Pod::Spec.new do |%s|\n' % self.get_pod_header(level))
+    self.write(f'Pod::Spec.new do |{self.get_pod_header(level)}|\n')
 
   def write_root_spec_str_internal(self, key, symbol, value, level, key_has_colon=False):
     space = self.get_pre_spaces(level)
-    title_line = '%s"%s" %s "%s"' % (space, key, symbol, value)
+    title_line = f'{space}"{key}" {symbol} "{value}"'
     if key_has_colon:
-      title_line = '%s:%s %s "%s"' % (space, key, symbol, value)
-    self.out.write(title_line)
+      title_line = f'{space}:{key} {symbol} "{value}"'
+    self.write(title_line)
 
   def write_root_spec_list_internal(self, key, symbol, values, level, key_has_colon=False):
     space = self.get_pre_spaces(level)
-    title_line = '%s"%s" %s ' % (space, key, symbol)
+    title_line = f'{space}"{key}" {symbol} '
     if key_has_colon:
-      title_line = '%s:%s %s ' % (space, key, symbol)
-    self.out.write(title_line)
-    title_line_len = len(title_line)
-    i = 0
-    self.out.write('"')
-    sub_space = ' ' * title_line_len
-    values_sorted = sorted(values)
-    for value in values_sorted:
-      i += 1
-      if i == 1:
-        self.out.write(value)
-      else:
-        self.out.write(sub_space + value)
-      if i < len(values_sorted):
-        self.out.write(' \\')
-        self.out.write('\n')
-    self.out.write('"')
+      title_line = f'{space}:{key} {symbol} '
+    separator = ' \\\n' + ' ' * len(title_line)
+    self.write(title_line + '"' + separator.join(sorted(values)) + '"')
 
   def write_root_spec_normal(self, header, key, symbol, value, level):
     if isinstance(value, bool):
       value = 'true' if value else 'false'
-    key_line = self.format_head_str('%s.%s' % (header, key), level)
-    title_line = '%s%s %s' % (key_line, symbol, value)
-    self.out.write(title_line)
+    key_line = self.format_head_str(f'{header}.{key}', level)
+    title_line = f'{key_line}{symbol} {value}'
+    self.write(title_line)
 
   def write_root_spec_str(self, header, key, symbol, value, level):
-    key_line = self.format_head_str('%s.%s' % (header, key), level)
-    title_line = '%s%s "%s"' % (key_line, symbol, value)
-    self.out.write(title_line)
+    key_line = self.format_head_str(f'{header}.{key}', level)
+    title_line = f'{key_line}{symbol} "{value}"'
+    self.write(title_line)
 
   def write_root_spec_list(self, header, key, symbol, values, level, should_new_line=False):
-    key_line = self.format_head_str('%s.%s' % (header, key), level)
-    title_line = '%s%s ' % (key_line, symbol)
-    self.out.write(title_line)
-    title_line_len = len(title_line)
-    i = 0
-    for value in values:
-      i += 1
-      if should_new_line:
-        sub_space = ' ' * title_line_len if i != 1 else ''
-        self.out.write('%s"%s"' % (sub_space, value))
-      else:
-        self.out.write('"%s"' % value)
-      if i < len(values):
-        self.out.write(', ')
-      if should_new_line:
-        self.out.write('\n')
+    key_line = self.format_head_str(f'{header}.{key}', level)
+    title_line = f'{key_line}{symbol} '
+    quoted_values = [f'"{value}"' for value in values]
+    if should_new_line:
+      separator = ', \n' + ' ' * len(title_line)
+      end = '\n' if quoted_values else ''
+    else:
+      separator = ', '
+      end = ''
+    self.write(title_line + separator.join(quoted_values) + end)
 
   def write_root_spec_dict(self, header, key, symbol, value, level):
-    key_line = self.format_head_str('%s.%s' % (header, key), level)
-    title_line = '%s%s {\n' % (key_line, symbol)
-    self.out.write(title_line)
+    key_line = self.format_head_str(f'{header}.{key}', level)
+    title_line = f'{key_line}{symbol} {{\n'
+    self.write(title_line)
     symbol_internal = '=>'
     key_has_colon = False
     if key in should_use_colon_specification:
@@ -451,20 +513,20 @@ class Writer:
       else:
         self.write_root_spec_str_internal(k, symbol_internal, value_impl, next_level, key_has_colon)
       if i < len(value):
-        self.out.write(',')
-      self.out.write('\n')
+        self.write(',')
+      self.write('\n')
     
-    self.out.write(self.get_pre_spaces(level) +'}')
+    self.write(self.get_pre_spaces(level) +'}')
     return 0
 
   def write_prepare_command(self, header, key, symbol, values, level):
-    key_line = self.format_head_str('%s.%s' % (header, key), level)
-    title_line = '%s%s <<-CMD\n' % (key_line, symbol)
+    key_line = self.format_head_str(f'{header}.{key}', level)
+    title_line = f'{key_line}{symbol} <<-CMD\n'
     for value in values:
       next_level = level + 1
-      title_line += self.get_pre_spaces(next_level) +'%s\n' % (value)
+      title_line += f'{self.get_pre_spaces(next_level)}{value}\n'
     title_line += self.get_pre_spaces(level) + 'CMD'
-    self.out.write(title_line)
+    self.write(title_line)
 
   def write_root_specification(self, root_specification, level):
     if len(root_specification) <= 0:
@@ -480,7 +542,7 @@ class Writer:
       value = root_specification[key]
       if(key == 'prepare_command'):
         self.write_prepare_command(header, key, symbol, value, next_level)
-        self.out.write('\n')
+        self.write('\n')
       else:
         if isinstance(value, dict):
           self.write_root_spec_dict(header, key, symbol, value, next_level)
@@ -490,30 +552,22 @@ class Writer:
           self.write_root_spec_str(header, key, symbol, value, next_level)
         else:
           self.write_root_spec_normal(header, key, symbol, value, next_level)
-        self.out.write('\n')
+        self.write('\n')
 
   def write_subspec_title(self, header, sub_header, spec_name, level, test_subspec):
     space = self.get_pre_spaces(level)
-    self.out.write('\n')
+    self.write('\n')
     if test_subspec:
-      self.out.write('%s%s.test_spec \"%s\" do |%s|\n' % (space, header, spec_name, sub_header))
+      self.write(f'{space}{header}.test_spec "{spec_name}" do |{sub_header}|\n')
     else:
-      self.out.write('%s%s.subspec \"%s\" do |%s|\n' % (space, header, spec_name, sub_header))
-
-  def write_list_content(self, key, value, header, space):
-    list_value = ''
-    for v in value:
-      list_value += '\"%s\", ' % (v)
-    list_value = list_value[:len(list_value)-2]
-    full_str = self.format_head_str(key, header, space) + ' = %s \n' %(list_value)
-    self.out.write(full_str)
+      self.write(f'{space}{header}.subspec "{spec_name}" do |{sub_header}|\n')
 
   def write_requires_arc(self, header, target, level, is_new_line=False):
     if len(target.requires_arc) <= 0:
       return
     if len(target.requires_arc) == 1 and target.requires_arc[0] in ['true', 'false']:
       self.write_root_spec_normal(header, 'requires_arc', '=', target.requires_arc[0], level)
-      self.out.write('\n')
+      self.write('\n')
       return
     self.write_specification_list(header, target, level, "requires_arc", is_new_line)
 
@@ -522,14 +576,14 @@ class Writer:
     if len(var) <= 0:
       return
     self.write_root_spec_list(header, specification_name, '=', var, level, is_new_line)
-    self.out.write('\n')
+    self.write('\n')
 
   def write_specification_str(self, header, target, level, specification_name):
     var = getattr(target, specification_name)
     if len(var) <= 0:
       return
     self.write_root_spec_str(header, specification_name, '=', var, level)
-    self.out.write('\n')
+    self.write('\n')
 
 
   def write_xc_configs(self, header, target, level):
@@ -537,63 +591,55 @@ class Writer:
     if len(pod_target_xcconfig) <= 0:
       return
     self.write_root_spec_dict(header, 'pod_target_xcconfig', '=', pod_target_xcconfig, level)
-    self.out.write('\n')
+    self.write('\n')
 
   def write_dependencies(self, header, target, level):
     dependencies = target.dependency
     if len(dependencies) == 0:
       return
-    dependencies_sorted = sorted(dependencies)
-    for dependency in dependencies_sorted:
-      key_line = self.format_head_str('%s.%s' % (header, 'dependency'), level)
-      self.out.write(key_line)
-      if dependency in target.dependency_versions.keys():
-        self.out.write('"%s", "%s"' % (dependency, target.dependency_versions[dependency]))
+    # target.dependency is sorted by parse_dependency and kept sorted by flatten merges.
+    key_line = self.format_head_str(f'{header}.dependency', level)
+    dependency_versions = target.dependency_versions
+    for dependency in dependencies:
+      if dependency in dependency_versions:
+        self.write(f'{key_line}"{dependency}", "{dependency_versions[dependency]}"\n')
       else:
-        self.out.write('"%s"' % dependency)
-      self.out.write('\n')
+        self.write(f'{key_line}"{dependency}"\n')
 
   def write_scheme(self, level, test_subspec):
     if test_subspec:
       header = self.get_pod_header(level, test_subspec)
-      self.out.write(self.format_head_str('%s.%s' % (header, 'scheme'), level))
-      self.out.write('= { :code_coverage => true }')
-      self.out.write('\n')
+      self.write(self.format_head_str(f'{header}.scheme', level))
+      self.write('= { :code_coverage => true }')
+      self.write('\n')
 
   def write_bundle_sources(self, resource_name, sources, level):
     space = self.get_pre_spaces(level)
-    title_line = '%s"%s" => ' % (space, resource_name)
-    self.out.write(title_line + '[\n')
-    title_line_len = len(title_line)
-    i = 0
-    sub_space = ' ' * title_line_len
-    for value in sources:
-      i += 1
-      self.out.write(sub_space + '  "%s"' % value)
-      if i < len(sources):
-        self.out.write(',')
-      self.out.write('\n')
-    self.out.write(sub_space + ']')
+    title_line = f'{space}"{resource_name}" => '
+    sub_space = ' ' * len(title_line)
+    lines = [f'{sub_space}  "{value}"' for value in sources]
+    end = '\n' if lines else ''
+    self.write(title_line + '[\n' + ',\n'.join(lines) + end + sub_space + ']')
 
   def write_bundle_data(self, header, target, level):
     # bundle_data will be converted to resource_bundles
     resource_bundles = target.resource_bundles
     if len(resource_bundles) == 0:
       return
-    self.out.write(self.format_head_str('%s.%s' % (header, 'resource_bundles'), level) + '= {\n')
+    self.write(self.format_head_str(f'{header}.resource_bundles', level) + '= {\n')
     next_level = level + 1
     i = 0
     for key in resource_bundles.keys():
       self.write_bundle_sources(key, resource_bundles[key], next_level)
       i += 1
       if i < len(resource_bundles.keys()):
-        self.out.write(',')
-      self.out.write('\n')
-    self.out.write(self.get_pre_spaces(level) + '}\n')
+        self.write(',')
+      self.write('\n')
+    self.write(self.get_pre_spaces(level) + '}\n')
 
   def write_end(self, level):
     space = self.get_pre_spaces(level)
-    self.out.write('%send\n' % space)
+    self.write(f'{space}end\n')
 
 
   def write_single_subspec(self, subspec_target, level):
@@ -633,13 +679,26 @@ class Writer:
   
   def write_single_condition_subspec(self, subspec_target, condition, level):
     space = self.get_pre_spaces(level)
-    self.out.write('%sif $%s==1' % (space, condition))
+    self.write(f'{space}if ${condition}==1')
     self.write_single_subspec(subspec_target, level)
     self.write_end(level)
 
+  def should_write_subspec(self, gn_name):
+    """
+    Check the cached metadata of gn_name before constructing its SubspecTarget,
+    only subspec_target deps are written as subspecs.
+    Unknown gn targets are left to get_subspec_target to report.
+    """
+    if gn_name in self.project.targets and not self.project.get_metadata(gn_name).is_subspec_target:
+      logging.warning('%s is not a subspec_target, it is not written as a subspec.', gn_name)
+      return False
+    return True
+
   def write_subspec_targets(self, subspec_targets, level):
     for subspec_name in subspec_targets:
-      subspec = SubspecTarget(subspec_name, self.project)
+      if not self.should_write_subspec(subspec_name):
+        continue
+      subspec = self.project.get_subspec_target(subspec_name)
       self.write_single_subspec(subspec, level)
 
   def write_condition_subspec_targets(self, condition_deps_list, level):
@@ -648,7 +707,9 @@ class Writer:
     for condition_subspec in condition_deps_list:
       subspec_name = condition_subspec[0]
       condition = condition_subspec[1]
-      subspec = SubspecTarget(subspec_name, self.project)
+      if not self.should_write_subspec(subspec_name):
+        continue
+      subspec = self.project.get_subspec_target(subspec_name)
       self.write_single_condition_subspec(subspec, condition, level)
   
 
@@ -670,6 +731,7 @@ def write_podspec(podspec_target):
   writer.write_header()
   writer.write_global_variables(podspec_target.global_variables)
   writer.write_podspec_target(podspec_target)
+  writer.close()
   return 0
 
 def gn_to_podspec(project_json, podspec_targets):
@@ -689,21 +751,18 @@ def read_json_file(json_file):
   if not os.path.exists(json_file):
     print("The json file %s is not existed." % json_file)
     return json_object
-  with open(json_file, "r+") as file:
-    json_object = json.loads(file.read())
-    file.close()
-  return json_object
+  data = Path(json_file).read_bytes()
+  # orjson decodes the large gn project json much faster than the json module.
+  if orjson is not None:
+    return orjson.loads(data)
+  return json.loads(data)
 
 def get_podspec_targets(podspec_targets_dir):
-  lines = []
-  for filename in os.listdir(podspec_targets_dir):
-    file_path = os.path.join(podspec_targets_dir, filename)
-    if os.path.isfile(file_path):
-      with open(file_path, "r+") as file:
-        lines += file.readlines()
-        file.close()
-  if len(lines) > 0:
-    podspec_targets = [line.replace("\n", "") for line in lines]
+  podspec_targets = []
+  with os.scandir(podspec_targets_dir) as entries:
+    for entry in entries:
+      if entry.is_file():
+        podspec_targets += [line for line in Path(entry.path).read_text().splitlines() if line]
   return podspec_targets
 
 def main():